@@ -4,12 +4,61 @@
 # https://machinelearningmastery.com/timedistributed-layer-for-long-short-term-memory-networks-in-python/
 # https://machinelearningmastery.com/how-to-develop-lstm-models-for-multi-step-time-series-forecasting-of-household-power-consumption/
 
+import tensorflow as tf
 from tensorflow import keras
 import pandas as pd
 import numpy as np
-import glob, os
+from numpy.lib.stride_tricks import sliding_window_view
+import os
+from pathlib import Path
+import warnings
+import hashlib
+import tempfile
+from datetime import datetime
+import joblib
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 from sklearn.preprocessing import StandardScaler, MinMaxScaler, RobustScaler
+from csv_parallel import parallel_read_csv
+
+# pyarrow is optional: without it csv files are parsed on every load, no parquet cache is written
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# numba is optional: without it sequences are unrolled with the NumPy sliding window path only
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True, fastmath=True)
+    def _unroll_kernel(X, y, seq_len, out_X, out_y):
+        """
+        fills preallocated out_X, out_y with the windows of X and the y following each window
+        """
+        for i in prange(out_X.shape[0]):
+            out_X[i] = X[i: i + seq_len]
+            out_y[i] = y[i + seq_len]
+
+
+def _train_test_frame(key):
+    """
+    property for train-test DF: assigning a new DF drops the np array cached from the previous one
+    """
+    def getter(self):
+        return self._frames.get(key)
+    
+    def setter(self, df):
+        self._frames[key] = df
+        self._arrays.pop(key, None)
+    
+    return property(getter, setter)
 
 
 class NeuralManager:
@@ -18,12 +67,29 @@ class NeuralManager:
     inits data. One instance has to be created for one set of data (cut, long, full...)
     combines the NN from user pattern, trains, saves the best weights
     """
+    # attribute names of train-test data; file is attached to the attribute whose name it contains
+    _train_test_keys = ('X_train', 'X_test', 'y_train', 'y_test')
+    # csv files starting from this size are parsed in parallel processes (when pyarrow reader is not available)
+    _parallel_read_min_bytes = 200 * 2**20
+    _parallel_read_workers = 4
+    
+    # DFs are the source of truth, their np values are taken lazily in self._helpers_train_test_array
+    X_train = _train_test_frame('X_train')
+    X_test = _train_test_frame('X_test')
+    y_train = _train_test_frame('y_train')
+    y_test = _train_test_frame('y_test')
+    
     # ===============================  Init  ====================================================
-    def __init__(self, dir_path=None):
+    def __init__(self, dir_path=None, strategy=None):
         """
         grabs all possible train_test splits from the dir and attaches to self.
+        
+        :param strategy: tf.distribute strategy to build and train the model under. 
+            Default is MirroredStrategy if several GPUs are visible, else the default (single device) strategy
         """
-        # DFs
+        # DFs (properties) and np arrays of their values, taken on first use
+        self._frames = dict()
+        self._arrays = dict()
         self.X_train = None
         self.X_test = None
         self.y_train = None
@@ -35,11 +101,24 @@ class NeuralManager:
         #NP arrays
         self.X_train_unrolled = None
         self.X_test_unrolled = None
+        self._dataset_cache = dict()
+        
+        # set on unroll: shape of one sample fed to the model is (sequence_len, n_features) before reshape
+        self.sequence_len = None
+        self.n_features = None
+        self.input_shape = None
         
         self.model = None
         self.scaler = None
+        self.dtype = np.float32
+        
+        if strategy is None:
+            strategy = (tf.distribute.MirroredStrategy() if len(tf.config.list_physical_devices('GPU')) > 1 
+                        else tf.distribute.get_strategy())
+        self.strategy = strategy
         
         self._train_test_init = dict()
+        self._dir_path = dir_path
         self._init_train_test_data(dir_path)
         
     
@@ -49,21 +128,20 @@ class NeuralManager:
         
         :param dir_path: dir where train test files located
         """
-        for file_path in [f for f in glob.glob(os.path.join(dir_path, "*.csv"))]:
-            file_name =  file_path.split('/')[-1].split('.')[0]
-            
-            if "X_train" in file_name:
-                self.X_train = pd.read_csv(file_path, index_col="Date").sort_index(ascending=True)
-                self._train_test_init['X_train'] = True
-            if "X_test" in file_name:
-                self.X_test = pd.read_csv(file_path, index_col="Date").sort_index(ascending=True)
-                self._train_test_init['X_test'] = True
-            if "y_train" in file_name:
-                self.y_train = pd.read_csv(file_path, index_col="Date").sort_index(ascending=True)
-                self._train_test_init['y_train'] = True
-            if "y_test" in file_name:
-                self.y_test = pd.read_csv(file_path, index_col="Date").sort_index(ascending=True)
-                self._train_test_init['y_test'] = True
+        keys_paths = []
+        # suffix is matched case-insensitively (*.csv, *.CSV)
+        for file_path in sorted(p for p in Path(dir_path).iterdir() if p.suffix.lower() == ".csv"):
+            key = next((k for k in self._train_test_keys if k in file_path.stem), None)
+            if key is not None:
+                keys_paths.append((key, str(file_path)))
+        
+        # files are read in parallel, but attached in sorted order: if several files match a key, the last one is kept
+        with ThreadPoolExecutor(max_workers=len(self._train_test_keys)) as executor:
+            futures = [(key, executor.submit(self._helpers_read_csv_cached, file_path)) 
+                       for key, file_path in keys_paths]
+            for key, future in futures:
+                setattr(self, key, future.result().sort_index(ascending=True))
+                self._train_test_init[key] = True
                 
         if verbose:
             print(">>> train-test inited: " , self._train_test_init)
@@ -72,15 +150,43 @@ class NeuralManager:
         
         
     # ===============================  Normalize, Power Transform, Split to Squ =================================
-    def normalize_X(self, scaler=None):
-        """
-        normalizes data with scaler (default is StandardScaler)
+    def normalize_X(self, scaler=None, dtype=np.float32, use_cache=True):
         """
+        normalizes data with scaler (default is StandardScaler, scaling in place)
         
-        self.scaler = StandardScaler() if scaler is None else scaler()
+        :param dtype: dtype of the normalized arrays (and of unrolled y). float32 is what keras computes in
+        :param use_cache: if True, fitted scaler is saved to dir_path/.cache and reused (transform only) 
+            while X_train data (values, index, columns) is the same
+        """
         
-        self.X_train_normalized = self.scaler.fit_transform(self.X_train)
-        self.X_test_normalized = self.scaler.transform(self.X_test)
+        self.scaler = StandardScaler(copy=False) if scaler is None else scaler()
+        self.dtype = dtype
+        
+        cache_path = self._helpers_scaler_cache_path(dtype) if use_cache else None
+        is_fitted = False
+        if (cache_path is not None) and os.path.exists(cache_path):
+            try:
+                self.scaler = joblib.load(cache_path)
+                is_fitted = True
+            except Exception as e:
+                # unreadable cache is a miss: scaler is refitted and the cache rewritten
+                print(f">>> cached scaler is not loaded: {e}")
+        
+        # np.array always copies: the single copy is made in dtype, and in-place scaling does not touch DFs
+        X_train = np.array(self._helpers_train_test_array('X_train'), dtype=dtype)
+        X_test = np.array(self._helpers_train_test_array('X_test'), dtype=dtype)
+        
+        if is_fitted:
+            self.X_train_normalized = self.scaler.transform(X_train).astype(dtype, copy=False)
+        else:
+            self.X_train_normalized = self.scaler.fit_transform(X_train).astype(dtype, copy=False)
+            if cache_path is not None:
+                try:
+                    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                    self._helpers_write_atomic(cache_path, lambda tmp_path: joblib.dump(self.scaler, tmp_path))
+                except OSError as e:
+                    print(f">>> scaler cache is not written: {e}")
+        self.X_test_normalized = self.scaler.transform(X_test).astype(dtype, copy=False)
                 
         return True
     
@@ -92,66 +198,150 @@ class NeuralManager:
         if len(X) != len(y):
             print(">>> X and y data should have same len...")
             return False
+        if len(X) <= sequence_length:
+            # no window has a y to predict: empty sets, as the loop based version returned
+            print(">>> X and y data should be longer than sequence_length...")
+            return (np.empty((0, sequence_length) + X.shape[1:], dtype=X.dtype), 
+                    np.empty((0,) + y.shape[1:], dtype=y.dtype))
+        
+        # windows come as (n_windows, n_features, sequence_length) --> swap to (n_windows, sequence_length, n_features)
+        # last window is dropped as it has no y to predict
+        windows_X = sliding_window_view(X, window_shape=sequence_length, axis=0)[:-1]
+        set_X = np.ascontiguousarray(windows_X.swapaxes(1, 2))
+        set_y = np.ascontiguousarray(y[sequence_length:])
+        
+        return set_X, set_y
+
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _unroll_XY_to_sequence_numba(X, y, sequence_length=4):
+        """
+        same as _unroll_XY_to_sequence, but copies the windows in parallel with numba.
+        Falls back to _unroll_XY_to_sequence if numba is not installed
+        """
+        if not NUMBA_AVAILABLE:
+            return NeuralManager._unroll_XY_to_sequence(X, y, sequence_length=sequence_length)
         
-        list_X = []
-        list_y = []
+        if len(X) != len(y):
+            print(">>> X and y data should have same len...")
+            return False
+        if len(X) <= sequence_length:
+            # no window has a y to predict: empty sets, as the loop based version returned
+            print(">>> X and y data should be longer than sequence_length...")
+            return (np.empty((0, sequence_length) + X.shape[1:], dtype=X.dtype), 
+                    np.empty((0,) + y.shape[1:], dtype=y.dtype))
         
-        for index in range(len(X) - sequence_length):
-            list_X.append(X[index: index + sequence_length])
-            list_y.append(y[index + sequence_length])
+        X = np.ascontiguousarray(X)
+        y = np.ascontiguousarray(y)
+        n_windows = len(X) - sequence_length
         
-        return np.asarray(list_X), np.asarray(list_y)
+        set_X = np.empty((n_windows, sequence_length) + X.shape[1:], dtype=X.dtype)
+        set_y = np.empty((n_windows,) + y.shape[1:], dtype=y.dtype)
+        _unroll_kernel(X, y, sequence_length, set_X, set_y)
+        
+        return set_X, set_y
 
     # ------------------------------------------------------------------------------------------------------------------#
-    def unroll_train_test_to_sequences(self, sequence_len):
+    def unroll_train_test_to_sequences(self, sequence_len, use_numba=False):
         """
         Splits X_normalized to sequences
         >>> Example: [1,2,3,4,5] n_steps/ sequence_len=3 --> [1,2,3], [2,3,4], [3,4,5]
+        
+        :param use_numba: if True, windows are copied with the numba kernel (falls back to NumPy if numba is missing)
         """
-        self.X_train_unrolled, self.y_train_unrolled = self._unroll_XY_to_sequence(
+        unroll_fn = self._unroll_XY_to_sequence_numba if use_numba else self._unroll_XY_to_sequence
+        self._dataset_cache = dict()
+        self.sequence_len = sequence_len
+        self.n_features = self.X_train_normalized.shape[1]
+        self.input_shape = (sequence_len, self.n_features)
+        
+        self.X_train_unrolled, self.y_train_unrolled = unroll_fn(
             X=self.X_train_normalized, 
-            y=self.y_train.values, 
+            y=self._helpers_train_test_array('y_train').astype(self.dtype, copy=False), 
             sequence_length=sequence_len)
         
-        self.X_test_unrolled, self.y_test_unrolled = self._unroll_XY_to_sequence(
+        self.X_test_unrolled, self.y_test_unrolled = unroll_fn(
             X=self.X_test_normalized, 
-            y=self.y_test.values, 
+            y=self._helpers_train_test_array('y_test').astype(self.dtype, copy=False), 
             sequence_length=sequence_len)    
         # ------------------------------------------------------------------------------------------------------------------#
     # TODO: PowerTransform
 
     # ===========================================  Model   =================================================
-    def model_combine(self, template:list, compile_model=True, compile_dict=None, metrics=None, verbose=True):
+    def model_combine(self, template:list, compile_model=True, compile_dict=None, metrics=None, verbose=True,
+                      mixed_precision=None, jit_compile=False, enforce_cudnn=False):
         """
         Combines self.model from template
         
-        :param template: list with layers
+        :param template: list with layers, or a callable returning such list 
+            (pass a callable for mixed_precision to apply: keras fixes layer dtype when the layer is created)
             >>> example: 
                 template = [
                             TimeDistributed(Conv1D(**conv1D_params, input_shape=(None, n_steps, n_features))),
                             TimeDistributed(MaxPooling1D(pool_size=2)),
                             TimeDistributed(Flatten()),
-                            LSTM(50, activation='relu'),
+                            LSTM(50),
                             Dense(1)
                         ]
         :param compile_model: if True, compile_dict has to be provided
         :param metrics: list of metrics that will be used in model compilation
+        :param mixed_precision: keras dtype policy ('mixed_float16', 'mixed_bfloat16', 'float32'), 
+            set only while template layers are created (global policy is restored afterwards).
+            Default is 'mixed_float16' if GPU is visible, else 'float32'
+        :param jit_compile: if True, model is compiled with XLA (fuses ops into fewer kernels). 
+            Used when compile_dict has no jit_compile key. Ignored (with warning) for models with LSTM/GRU: 
+            XLA can not lower the fused CuDNN kernel and falls back to generic RNN loop
+        :param enforce_cudnn: if True, LSTM/GRU layers that can not run on the fused CuDNN kernel are rebuilt 
+            with CuDNN compatible params. If False -- only warning is shown
         """
-        
-        self.model = keras.Sequential()
-        for layer in template:                
-            self.model.add(layer)
+        if mixed_precision is None:
+            mixed_precision = 'mixed_float16' if tf.config.list_physical_devices('GPU') else 'float32'
+        
+        prev_policy = keras.mixed_precision.global_policy()
+        keras.mixed_precision.set_global_policy(mixed_precision)
+        try:
+            if callable(template):
+                template = template()
+            template = self._helpers_validate_template(template, enforce_cudnn=enforce_cudnn)
+            
+            with self.strategy.scope():
+                self.model = keras.Sequential()
+                for layer in template:                
+                    self.model.add(layer)
+        finally:
+            keras.mixed_precision.set_global_policy(prev_policy)
         
         if metrics is None:
             metrics = ['mae']
             
         if compile_model and (compile_dict is None):
             compile_dict = dict()
-            compile_defaults = dict(optimizer='adam', loss='rmse', metrics=['mae'])            
+            compile_defaults = dict(optimizer='adam', loss='mse', metrics=['mae'])
             self._helpers_set_dict_default(compile_dict, compile_defaults)
-            
         
-        self.model.compile(**compile_dict)
+        # copy, so that caller's dict is not modified
+        compile_dict = dict(compile_dict)
+        if jit_compile and ('jit_compile' not in compile_dict):
+            has_rnn = any(isinstance(layer, (keras.layers.LSTM, keras.layers.GRU)) 
+                          for layer in self._helpers_flatten_layers(self.model.layers))
+            if has_rnn:
+                warnings.warn("jit_compile ignored: model has LSTM/GRU layers, XLA would replace CuDNN kernel "
+                              "with generic RNN loop")
+            else:
+                compile_dict['jit_compile'] = True
+        
+        # layers keep the policy they were created with, so the built model is checked, not mixed_precision
+        has_float16 = any(layer.compute_dtype == 'float16' for layer in self._helpers_flatten_layers(self.model.layers))
+        
+        with self.strategy.scope():
+            if has_float16:
+                # loss scaling keeps small fp16 gradients from underflowing to 0
+                optimizer = keras.optimizers.get(compile_dict.get('optimizer', 'adam'))
+                if not isinstance(optimizer, keras.mixed_precision.LossScaleOptimizer):
+                    optimizer = keras.mixed_precision.LossScaleOptimizer(optimizer)
+                compile_dict['optimizer'] = optimizer
+            
+            self.model.compile(**compile_dict)
         print(">>> model compiled")
         
         if verbose:
@@ -159,14 +349,96 @@ class NeuralManager:
         
         return True
     
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _make_dataset(dataset, batch_size, training):
+        """
+        Builds tf.data pipeline over dataset of samples, so that batches are prepared while the device computes 
+        the previous step. Cheap: dataset tensors are not copied
+        
+        :param training: if True, samples are reshuffled each epoch (as keras does for arrays)
+        """
+        # samples are in memory already: no .cache(), it would only keep one more full copy
+        if training:
+            dataset = dataset.shuffle(dataset.cardinality(), reshuffle_each_iteration=True)
+        
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    
+    # ------------------------------------------------------------------------------------------------------------------#
+    def _check_data_shapes(self, data_shape_train, data_shape_test):
+        """
+        Checks that data shapes split unrolled data into samples of (sequence_len, n_features):
+            >> (n_rows, n_seq, [n_steps_subseq,] n_features): n_seq * n_steps_subseq has to give back sequence_len
+            >> (n_rows, sequence_len * n_features): flattened samples
+            >> one dim may be -1 (as in np.reshape)
+        
+        returns: True if shapes are valid, else prints the problem and returns False
+        """
+        sample_size = self.sequence_len * self.n_features
+        
+        for data_shape, unrolled in ((data_shape_train, self.X_train_unrolled), (data_shape_test, self.X_test_unrolled)):
+            shape = list(data_shape)
+            if shape.count(-1) > 1:
+                print(f">>> data_shape {tuple(data_shape)}: only one dim can be -1...")
+                return False
+            if -1 in shape:
+                known_size = int(np.prod([dim for dim in shape if dim != -1]))
+                if (known_size == 0) or (unrolled.size % known_size != 0):
+                    print(f">>> data_shape {tuple(data_shape)} can not reshape {unrolled.shape}...")
+                    return False
+                shape[shape.index(-1)] = unrolled.size // known_size
+            
+            if ((shape[0] != len(unrolled)) or (int(np.prod(shape[1:])) != sample_size) 
+                    or (len(shape) > 2 and shape[-1] != self.n_features)):
+                print(f">>> data_shape {tuple(data_shape)} does not split {unrolled.shape} "
+                      f"(sequence_len={self.sequence_len}, n_features={self.n_features}). "
+                      f"Check n_seq * n_steps_subseq and n_features...")
+                return False
+        
+        return True
+    
+    # ------------------------------------------------------------------------------------------------------------------#
+    def _prepare_fit_datasets(self, data_shape_train, data_shape_test, batch_size):
+        """
+        Reshapes X_train_unrolled, X_test_unrolled into model input shapes and wraps them into tf.data datasets. 
+        Tensors (unbatched datasets) are cached per resolved shapes till the next unroll, so repeated model_fit calls 
+        (also with other batch_size) do not convert the data to tensors again
+        
+        :param batch_size: batch size per replica
+        
+        returns: train_ds, test_ds
+        """
+        # unrolled arrays are contiguous: reshape is a view, it only resolves -1 dims for the key
+        x_train = self.X_train_unrolled.reshape(*data_shape_train)
+        x_test = self.X_test_unrolled.reshape(*data_shape_test)
+        key = (x_train.shape, x_test.shape)
+        
+        if key not in self._dataset_cache:
+            # data is copied once -- into the dataset tensors
+            self._dataset_cache[key] = (
+                tf.data.Dataset.from_tensor_slices((x_train, self.y_train_unrolled)),
+                tf.data.Dataset.from_tensor_slices((x_test, self.y_test_unrolled))
+            )
+        train_samples, test_samples = self._dataset_cache[key]
+        
+        global_batch_size = batch_size * self.strategy.num_replicas_in_sync
+        return (self._make_dataset(train_samples, batch_size=global_batch_size, training=True), 
+                self._make_dataset(test_samples, batch_size=global_batch_size, training=False))
+    
     # ------------------------------------------------------------------------------------------------------------------#
     def model_fit(self, data_shape_train, data_shape_test, n_epoch=None, batch_size=32, verbose=2, early_stopping=True,
-                  print_charts=True, use_tensorboard=False, return_results=False):
+                  print_charts=True, use_tensorboard=False, return_results=False, reduce_lr=True, callbacks=None, 
+                  log_dir=None, label_epochs=False):
         """
         Fits the self.model, plots dynamics
         uses self.Xy_traintest_unrolled as input data for model
         
         :parameter data_shape_train: tuple to unpack in x_train.reshape 
+        :param early_stopping: if True, stops when val_loss does not improve for 5 epochs, restores the best weights
+        :param reduce_lr: if True, halves learning rate when val_loss does not improve for 3 epochs
+        :param callbacks: list of additional keras callbacks
+        :param log_dir: TensorBoard logs dir (if use_tensorboard). Default is logs/<timestamp>
+        :param label_epochs: if True, each epoch point of val_loss on the chart is labeled with its value
         """
         if self.model is None:
             print(">>>No model detected. First you have to combine it...")
@@ -176,28 +448,31 @@ class NeuralManager:
         if (data_shape_train is None) or (data_shape_test is None):
             print(">>> data_shape is an obligatory param!!")
             return False
+        if not self._check_data_shapes(data_shape_train, data_shape_test):
+            return False
 
-        n_features = self.X_train.shape[1]
-        
-        x_train = self.X_train_unrolled 
-        y_train = self.y_train_unrolled
-        x_train = x_train.reshape(*data_shape_train)
-
-        x_test = self.X_test_unrolled 
-        y_test = self.y_test_unrolled
-        x_test = x_test.reshape(*data_shape_test)
+        # batch_size is per replica: the global batch is split between the devices of self.strategy
+        train_ds, test_ds = self._prepare_fit_datasets(data_shape_train, data_shape_test, batch_size)
+        
+        fit_callbacks = []
+        if early_stopping:
+            fit_callbacks.append(keras.callbacks.EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True))
+        if reduce_lr:
+            fit_callbacks.append(keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3))
+        if use_tensorboard:
+            if log_dir is None:
+                log_dir = os.path.join("logs", datetime.now().strftime("%Y%m%d_%HH%MM%SS"))
+            fit_callbacks.append(keras.callbacks.TensorBoard(log_dir=log_dir))
+        if callbacks is not None:
+            fit_callbacks.extend(callbacks)
         
-        ES_callback = keras.callbacks.EarlyStopping(monitor='loss', patience=3) 
         fit_params = dict(
-                            x=x_train, y=y_train,
+                            x=train_ds,
                             epochs=n_epoch,
-                            batch_size=batch_size,
-                            validation_data=(x_test, y_test),
+                            validation_data=test_ds,
                             verbose=verbose,
-                            callbacks=[ES_callback] 
+                            callbacks=fit_callbacks
         )
-        if not early_stopping:
-            fit_params.pop('callbacks')
             
         results = self.model.fit(**fit_params)
         
@@ -216,6 +491,7 @@ class NeuralManager:
                                      x_lim=None, 
                                      y_lim=None, 
                                      label_series_base=val_loss, 
+                                     label_series=label_epochs,
                                      shift=+5e-4)
                         
             
@@ -237,6 +513,89 @@ class NeuralManager:
         return True
     
     # ------------------------------------------------------------------------------------------------------------------#
+    def model_fit_compiled(self, data_shape_train, data_shape_test, n_epoch=None, batch_size=32, verbose=2):
+        """
+        Fits the self.model with a custom training step compiled by XLA as a whole (forward, loss, gradients, update).
+        Models with LSTM/GRU are not XLA compiled (XLA would replace CuDNN kernel with generic RNN loop).
+        Lighter than model_fit: no callbacks, no metrics besides loss, no charts.
+        Loss and optimizer are taken from the compiled self.model
+        
+        :parameter data_shape_train: tuple to unpack in x_train.reshape 
+        
+        returns: dict(loss=[...], val_loss=[...]) -- by epoch
+        """
+        if self.model is None or self.model.optimizer is None:
+            print(">>>No compiled model detected. First you have to combine it...")
+            return False
+        if n_epoch is None:
+            n_epoch = 10
+        if (data_shape_train is None) or (data_shape_test is None):
+            print(">>> data_shape is an obligatory param!!")
+            return False
+        if not self._check_data_shapes(data_shape_train, data_shape_test):
+            return False
+        
+        train_ds, test_ds = self._prepare_fit_datasets(data_shape_train, data_shape_test, batch_size)
+        train_ds = self.strategy.experimental_distribute_dataset(train_ds)
+        
+        model = self.model
+        optimizer = model.optimizer
+        loss_fn = keras.losses.get(model.loss)
+        # per-sample losses, averaged over global batch below (keras Loss reduction is not allowed in replica context)
+        per_sample_loss_fn = loss_fn.call if isinstance(loss_fn, keras.losses.Loss) else loss_fn
+        scale_loss = isinstance(optimizer, keras.mixed_precision.LossScaleOptimizer)
+        # keras 3: scale_loss(), apply_gradients unscales itself; keras 2: get_scaled_loss/get_unscaled_gradients
+        scale_loss_keras3 = scale_loss and hasattr(optimizer, 'scale_loss')
+        has_rnn = any(isinstance(layer, (keras.layers.LSTM, keras.layers.GRU)) 
+                      for layer in self._helpers_flatten_layers(model.layers))
+        
+        def replica_step_fn(x, y):
+            with tf.GradientTape() as tape:
+                pred = model(x, training=True)
+                loss = tf.nn.compute_average_loss(per_sample_loss_fn(y, pred))
+                if model.losses:
+                    # kernel/activity regularization penalties, as keras fit adds them
+                    loss += tf.nn.scale_regularization_loss(tf.add_n(model.losses))
+                if scale_loss_keras3:
+                    scaled_loss = optimizer.scale_loss(loss)
+                elif scale_loss:
+                    scaled_loss = optimizer.get_scaled_loss(loss)
+                else:
+                    scaled_loss = loss
+            grads = tape.gradient(scaled_loss, model.trainable_variables)
+            if scale_loss and not scale_loss_keras3:
+                grads = optimizer.get_unscaled_gradients(grads)
+            optimizer.apply_gradients(zip(grads, model.trainable_variables))
+            return tf.cast(loss, tf.float32)
+        
+        replica_step = tf.function(replica_step_fn, jit_compile=not has_rnn)
+        
+        @tf.function
+        def train_step(x, y):
+            per_replica_loss = self.strategy.run(replica_step, args=(x, y))
+            return self.strategy.reduce(tf.distribute.ReduceOp.SUM, per_replica_loss, axis=None)
+        
+        history = dict(loss=[], val_loss=[])
+        for epoch in range(n_epoch):
+            # loss is summed on device; converting to python float once per epoch keeps steps dispatched async
+            epoch_loss, n_batches = tf.constant(0., dtype=tf.float32), 0
+            for x, y in train_ds:
+                epoch_loss += train_step(x, y)
+                n_batches += 1
+            if n_batches == 0:
+                print(">>> no train batches: check X_train_unrolled and data_shape_train...")
+                return False
+            
+            val_loss = model.evaluate(test_ds, verbose=0, return_dict=True)['loss']
+            history['loss'].append(float(epoch_loss) / n_batches)
+            history['val_loss'].append(val_loss)
+            
+            if verbose:
+                print(f">>> epoch {epoch + 1}/{n_epoch}: loss={history['loss'][-1]:.4f}, val_loss={val_loss:.4f}")
+        
+        return history
+    
+    # ------------------------------------------------------------------------------------------------------------------#
 #     def plot_predicted_price(self):
 #         """"
 #         Plots predicted price for test part of the data 
@@ -265,6 +624,178 @@ class NeuralManager:
         if isinstance(keys, dict):
             for key, val in keys.items():
                 dictionar[key] = dictionar[key] if key in dictionar else val
+    # ------------------------------------------------------------------------------------------------------------------#
+    def _helpers_train_test_array(self, key):
+        """
+        np values of train-test DF (key: 'X_train'...), taken once and reused till the DF is reassigned.
+        Float32 DFs give a view, no copy. In-place changes of DF structure (e.g. drop(inplace=True)) are not 
+        tracked -- reassign the DF instead
+        
+        returns: np array
+        """
+        if key not in self._arrays:
+            self._arrays[key] = getattr(self, key).to_numpy()
+        
+        return self._arrays[key]
+    # ------------------------------------------------------------------------------------------------------------------#
+    def _helpers_scaler_cache_path(self, dtype):
+        """
+        Path of the cached scaler: key is a hash of the data that is fitted (current X_train: shape, columns, 
+        dtypes, values with index), scaler params and dtype. So changes to X_train after load refit the scaler
+        
+        returns: path in dir_path/.cache, or None if there is no dir_path
+        """
+        if self._dir_path is None:
+            return None
+        
+        key_src = (self.X_train.shape, list(self.X_train.columns), [str(dt) for dt in self.X_train.dtypes], 
+                   int(pd.util.hash_pandas_object(self.X_train).sum()), 
+                   type(self.scaler).__name__, sorted(self.scaler.get_params().items()), np.dtype(dtype).name)
+        key = hashlib.md5(str(key_src).encode()).hexdigest()
+        
+        return os.path.join(self._dir_path, ".cache", f"scaler_{key}.pkl")
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _helpers_read_csv(file_path):
+        """
+        Reads csv with Date index (parsed to dates) and all other columns as float32.
+        Uses multithreaded pyarrow csv reader when pyarrow is installed, 
+        otherwise big files (>= _parallel_read_min_bytes) are parsed by chunks in parallel processes
+        
+        returns: pd.DataFrame
+        """
+        columns = pd.read_csv(file_path, nrows=0).columns
+        # Date is parsed and set as index after reading: pyarrow engine fails on index_col together with dtype 
+        # and ignores parse_dates
+        read_params = dict(dtype={col: np.float32 for col in columns if col != "Date"})
+        if PYARROW_AVAILABLE:
+            read_params['engine'] = 'pyarrow'
+        
+        if (not PYARROW_AVAILABLE) and (os.path.getsize(file_path) >= NeuralManager._parallel_read_min_bytes):
+            df = parallel_read_csv(file_path, dict(read_params, names=list(columns)),
+                                   workers=NeuralManager._parallel_read_workers)
+        else:
+            df = pd.read_csv(file_path, **read_params)
+        
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df.set_index("Date")
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _helpers_read_csv_cached(file_path):
+        """
+        Reads csv (see _helpers_read_csv) through a parquet copy stored next to it.
+            >> parquet is (re)written when missing or older than the csv
+            >> if parquet can not be written (e.g. read-only dir), parsed csv is returned
+            >> without pyarrow csv is read directly
+        
+        returns: pd.DataFrame
+        """
+        if not PYARROW_AVAILABLE:
+            return NeuralManager._helpers_read_csv(file_path)
+        
+        cache_path = os.path.splitext(file_path)[0] + ".parquet"
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+            return pd.read_parquet(cache_path)
+        
+        df = NeuralManager._helpers_read_csv(file_path)
+        try:
+            NeuralManager._helpers_write_atomic(cache_path, lambda tmp_path: df.to_parquet(tmp_path, compression='zstd'))
+        except OSError as e:
+            print(f">>> parquet cache is not written: {e}")
+        
+        return df
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _helpers_write_atomic(path, write_fn):
+        """
+        Writes file via temp file in the same dir, replaced into path only when complete: 
+        concurrent readers see either old file or the whole new one
+        
+        :param write_fn: function(tmp_path) that writes the content
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        os.close(fd)
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _helpers_inner_layers(layer):
+        """
+        Layers wrapped by layer: Wrapper (TimeDistributed...) --> [layer.layer], 
+        Bidirectional --> [forward_layer, backward_layer] (in keras 3 it is not a Wrapper), else []
+        """
+        if isinstance(layer, keras.layers.Bidirectional):
+            return [layer.forward_layer, layer.backward_layer]
+        if isinstance(layer, keras.layers.Wrapper):
+            return [layer.layer]
+        return []
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _helpers_flatten_layers(layers):
+        """
+        returns: list of layers together with all layers wrapped in them (recursively)
+        """
+        flat_layers = []
+        for layer in layers:
+            flat_layers.append(layer)
+            flat_layers.extend(NeuralManager._helpers_flatten_layers(NeuralManager._helpers_inner_layers(layer)))
+        
+        return flat_layers
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _helpers_validate_template(template, enforce_cudnn=False):
+        """
+        Checks template layers before they are added to the model.
+            >> LSTM/GRU (also wrapped, e.g. in Bidirectional) should be CuDNN compatible: 
+                otherwise keras runs generic RNN loop, that is several times slower. 
+                Warns, or rebuilds the layer with CuDNN params if enforce_cudnn
+            >> output layer has to compute in float32 (mixed precision keeps the loss in fp32), 
+                if it does not -- float32 linear activation is appended
+        
+        returns: list of layers (template is not modified)
+        """
+        template = list(template)
+        
+        for i, layer in enumerate(template):
+            inner_layers = NeuralManager._helpers_inner_layers(layer)
+            rnn_layer = inner_layers[0] if inner_layers else layer
+            if not isinstance(rnn_layer, (keras.layers.LSTM, keras.layers.GRU)):
+                continue
+            
+            cudnn_params = dict(activation='tanh', recurrent_activation='sigmoid', recurrent_dropout=0, 
+                                unroll=False, use_bias=True)
+            if isinstance(rnn_layer, keras.layers.GRU):
+                cudnn_params['reset_after'] = True
+            
+            rnn_config = rnn_layer.get_config()
+            mismatches = {key: rnn_config[key] for key, val in cudnn_params.items() 
+                          if key in rnn_config and rnn_config[key] != val}
+            if not mismatches:
+                continue
+                
+            if not enforce_cudnn:
+                warnings.warn(f"{layer.name} is not CuDNN compatible ({mismatches}), generic RNN kernel will be used. "
+                              f"Pass enforce_cudnn=True to rebuild it with {cudnn_params}")
+                continue
+            
+            config = layer.get_config()
+            if rnn_layer is layer:
+                config.update(cudnn_params)
+            else:
+                config['layer']['config'].update(cudnn_params)
+                if config.get('backward_layer') is not None:
+                    config['backward_layer']['config'].update(cudnn_params)
+            template[i] = layer.__class__.from_config(config)
+            print(f">>> {layer.name} rebuilt with CuDNN compatible params (was: {mismatches})")
+        
+        if template and template[-1].compute_dtype != 'float32':
+            template.append(keras.layers.Activation('linear', dtype='float32'))
+            
+        return template
     # ------------------------------------------------------------------------------------------------------------------#                
     @staticmethod
     def _helpers_plt_set_ax_properties(ax=None, ax_properties=None):
@@ -278,6 +809,7 @@ class NeuralManager:
             1: dict(ch_title='Loss by Epoch\n', x_label='epochs', y_label='Loss', x_lim=None, y_lim=None,
                 label_series_base=val_loss, shift=+5e-4)
         }
+            >> label_series=True additionally labels each point of label_series_base (off by default)
         :return:
         """
 
@@ -289,13 +821,28 @@ class NeuralManager:
         ax.grid(True, color='0.90')
   
         # ax_properties        
-#         for i, val in enumerate(ax_properties['label_series_base']):
-#                 ax.text(i, val + ax_properties['shift'], f"{val:.1f}", rotation=45)
-                
+        if ax_properties.get('label_series', False):
+            NeuralManager._helpers_plt_label_series(ax=ax, 
+                                                    arr_of_labels=ax_properties['label_series_base'], 
+                                                    shift=ax_properties['shift'])
         
         ax.set_ylim(ax_properties['y_lim'])
         ax.set_title(ax_properties['ch_title'], fontweight='bold')  # oc='left')
         ax.set_xlabel(ax_properties['x_label'])
         ax.set_ylabel(ax_properties['y_label'])
         
-    # ------------------------------------------------------------------------------------------------------------------#
\ No newline at end of file
+    # ------------------------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def _helpers_plt_label_series(ax, arr_of_labels, shift=0, fmt='%.1f'):
+        """
+        labels each point of arr_of_labels (x is the position in array) with its value, shifted up by shift
+        
+        :param fmt: printf-style format, applied to the whole array at once
+        """
+        arr_of_labels = np.asarray(arr_of_labels)
+        labels = np.char.mod(fmt, arr_of_labels)
+        y_positions = arr_of_labels + shift
+        
+        for i, (label, y) in enumerate(zip(labels, y_positions)):
+            ax.text(i, y, label, rotation=45)
+    # ------------------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,63 @@
+"""
+Parsing of big csv files by byte ranges in parallel processes.
+
+Kept apart from cls_nnetwork on purpose: worker processes import this module to unpickle the parse function,
+so it must stay light (no tensorflow import).
+"""
+import os
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+
+def _read_csv_byte_range(file_path, start, end, read_params):
+    """
+    parses rows of csv located in bytes [start, end) of the file (range has to start at the beginning of a row)
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    return pd.read_csv(io.BytesIO(data), header=None, **read_params)
+
+
+def _get_mp_context():
+    """
+    forkserver (spawn where it is not supported): forking a process with running tensorflow threads can deadlock.
+    Server preloads only this module, not the caller's __main__
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+
+    return multiprocessing.get_context('spawn')
+
+
+def parallel_read_csv(file_path, read_params, workers=4):
+    """
+    splits csv into workers byte ranges on row boundaries and parses them in parallel processes
+
+    :param read_params: pd.read_csv params, has to contain names (header row is skipped)
+
+    returns: pd.DataFrame
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        f.readline()  # header
+        bounds = [f.tell()]
+        for i in range(1, workers):
+            f.seek(max(bounds[0] + (file_size - bounds[0]) * i // workers, bounds[-1]))
+            f.readline()  # moving to the beginning of the next row
+            bounds.append(f.tell())
+    bounds.append(file_size)
+
+    ranges = [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_get_mp_context()) as executor:
+        chunks = executor.map(_read_csv_byte_range,
+                              [file_path] * len(ranges),
+                              [start for start, _ in ranges],
+                              [end for _, end in ranges],
+                              [read_params] * len(ranges))
+        return pd.concat(list(chunks))